@@ -1,26 +1,140 @@
+import functools
+import math
+import operator
 import numpy as np
 import matplotlib.pyplot as plt
 import plotly.graph_objs as go
-from scipy.interpolate import interp1d
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+
+def _continuous_attenuation_kernel(mus, thicks, I0, ppl):
+    """
+    Fused loop computing positions and intensities on a fine grid through each layer.
+    """
+    n = len(mus)
+    positions = np.empty(n * ppl, dtype=np.float32)
+    intensities = np.empty(n * ppl, dtype=np.float32)
+    step = 1.0 / (ppl - 1) if ppl > 1 else 0.0
+
+    start = 0.0
+    tau = 0.0
+    k = 0
+    for layer in range(n):
+        mu = mus[layer]
+        thick = thicks[layer]
+        for j in range(ppl):
+            dx = thick * (j * step)
+            positions[k] = start + dx
+            intensities[k] = I0 * math.exp(-(tau + mu * dx))
+            k += 1
+        start += thick
+        tau += mu * thick
+
+    return positions, intensities
+
+
+# Compile the kernel when Numba is available, otherwise fall back to NumPy
+_kernel = njit(cache=True, fastmath=True)(_continuous_attenuation_kernel) if njit is not None else None
+
+
+@functools.lru_cache(maxsize=None)
+def _unit_grid(ppl):
+    """
+    Read-only grid of ppl points on [0, 1], scaled by each layer's thickness.
+    """
+    u = np.linspace(0.0, 1.0, ppl, dtype=np.float32)
+    u.setflags(write=False)
+    return u
+
+
+@functools.lru_cache(maxsize=32)
+def compile_layered_kernel(n_layers, ppl):
+    """
+    Generate a continuous attenuation kernel unrolled for a fixed number of layers.
+
+    Parameters
+    ----------
+    n_layers : int
+        The number of layers the kernel handles.
+    ppl : int
+        The number of points computed within each layer.
+
+    Returns
+    -------
+    A function ``k(mus, thicks, I0)`` returning the positions and intensities
+    as two float32 arrays. Kernels are cached by (n_layers, ppl).
+    """
+    # Both values are inserted into generated source, so only accept integers
+    n_layers = operator.index(n_layers)
+    ppl = operator.index(ppl)
+    if n_layers < 0 or ppl < 0:
+        raise ValueError("n_layers and ppl must be non-negative")
+
+    if n_layers == 0:
+        return lambda mus, thicks, I0: (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32))
+
+    lines = [
+        "def k(mus, thicks, I0):",
+        f"    u = _unit_grid({ppl})",
+        "    start = np.float32(0.0)",
+        "    tau = np.float32(0.0)",
+    ]
+    for i in range(n_layers):
+        lines += [
+            f"    x{i} = u * thicks[{i}]",
+            f"    p{i} = start + x{i}",
+            f"    q{i} = I0 * np.exp(-(tau + mus[{i}] * x{i}))",
+            f"    start = start + thicks[{i}]",
+            f"    tau = tau + mus[{i}] * thicks[{i}]",
+        ]
+    positions = ", ".join(f"p{i}" for i in range(n_layers))
+    intensities = ", ".join(f"q{i}" for i in range(n_layers))
+    lines.append(f"    return np.concatenate(({positions},)), np.concatenate(({intensities},))")
+
+    namespace = {"np": np, "_unit_grid": _unit_grid}
+    exec("\n".join(lines), namespace)
+    return namespace["k"]
+
 
 class XRayAttenuationPlot:
     def __init__(self):
         """
         Initialize XRay Attenuation Plot with default material properties.
         """
-        self.energies_data = np.array([0.01, 0.1, 1, 10, 20])
+        # Tabulated values are only good to a few significant figures, so single precision suffices
+        self.energies_data = np.array([0.01, 0.1, 1, 10, 20], dtype=np.float32)
         self.mac = {
-            "bone": np.array([28.51, 0.1855, 0.0656, 0.02314, 0.02068]),
-            "soft_tissue": np.array([4.937, 0.1688, 0.07003, 0.02191, 0.01785]),
-            "air": np.array([5.120, 0.1541, 0.06358, 0.02045, 0.01705])
+            "bone": np.array([28.51, 0.1855, 0.0656, 0.02314, 0.02068], dtype=np.float32),
+            "soft_tissue": np.array([4.937, 0.1688, 0.07003, 0.02191, 0.01785], dtype=np.float32),
+            "air": np.array([5.120, 0.1541, 0.06358, 0.02045, 0.01705], dtype=np.float32)
         }
         self.densities = {"bone": 1.92, "soft_tissue": 1.03, "air": 0.001225}
         
-        # Create interpolation functions for each material
-        self.interp_funcs = {
-            mat: interp1d(self.energies_data, data, kind='linear', fill_value='extrapolate') 
-            for mat, data in self.mac.items()
-        }
+        # Linear attenuation coefficient tables (density folded into the MAC values).
+        self.lac_table = {mat: (self.mac[mat] * self.densities[mat]).astype(np.float32) for mat in self.mac}
+
+        # Attenuation is close to a power law in energy, so interpolate on a log-log grid
+        # with the per-interval slopes precomputed.
+        self._log_e = np.log(self.energies_data)
+        self._log_lac = {mat: np.log(tab) for mat, tab in self.lac_table.items()}
+        self._slopes = {mat: np.diff(log_lac) / np.diff(self._log_e) for mat, log_lac in self._log_lac.items()}
+
+        # Per-instance LRU cache of linear attenuation coefficients keyed by (material, energy)
+        self._mu = functools.lru_cache(maxsize=256)(self._interpolate_lac)
+
+        # Integer id per material, indexing the arrays returned by _lacs_for,
+        # with a per-instance LRU cache of those arrays keyed by energy
+        self._mat_ids = {mat: i for i, mat in enumerate(self.lac_table)}
+        self._lacs_for = functools.lru_cache(maxsize=64)(self._compute_lacs)
 
     def get_linear_attenuation_coefficient(self, material, energy):
         """
@@ -30,21 +144,55 @@ class XRayAttenuationPlot:
         ----------
         material : str
             The name of the material (e.g. "bone", "soft_tissue", "air")
-        energy : float
-            The energy level in MeV
+        energy : float or array-like
+            The energy level(s) in MeV
 
         Returns
         -------
-        The linear attenuation coefficient in cm^-1
+        The linear attenuation coefficient(s) in cm^-1
+        """
+        if np.ndim(energy) > 0:
+            # Batched lookup, evaluated in one vectorized pass
+            return self._interpolate_lac(material, np.asarray(energy, dtype=float))
+
+        return self._mu(material, float(energy))
+
+    def _compute_lacs(self, energy):
+        """
+        Read-only linear attenuation coefficients of all materials at one energy, ordered by material id.
         """
-        if material not in self.mac:
+        lacs = np.array([self._mu(mat, energy) for mat in self._mat_ids], dtype=np.float32)
+        lacs.setflags(write=False)
+        return lacs
+
+    def _layer_mus(self, tissues, energy):
+        """
+        Gather the linear attenuation coefficient of each layer's tissue at the given energy.
+        """
+        try:
+            ids = np.fromiter((self._mat_ids[tissue] for tissue in tissues), dtype=np.intp, count=len(tissues))
+        except KeyError as e:
+            raise ValueError(f"Unknown material: {e.args[0]}") from None
+
+        return self._lacs_for(float(energy))[ids]
+
+    def _interpolate_lac(self, material, energy):
+        """
+        Interpolate the linear attenuation coefficient table at scalar or array energies.
+        """
+        log_lac = self._log_lac.get(material)
+        if log_lac is None:
             raise ValueError(f"Unknown material: {material}")
+        if np.any(np.asarray(energy) <= 0):
+            raise ValueError(f"Energy must be positive: {energy}")
 
-        # Interpolate mass attenuation coefficient
-        mac_value = self.interp_funcs[material](energy)
-        
-        # Calculate linear attenuation coefficient
-        return mac_value * self.densities[material]
+        # Locate the enclosing interval (end intervals extrapolate along their slope)
+        le = np.log(energy)
+        i = np.searchsorted(self._log_e, le) - 1
+        i = np.clip(i, 0, len(self._log_e) - 2)
+
+        # Evaluate the log-log line through the interval
+        return np.exp(log_lac[i] + self._slopes[material][i] * (le - self._log_e[i]))
     
     def transmitted_intensity(self, I0, mu, thickness):
         """
@@ -56,16 +204,24 @@ class XRayAttenuationPlot:
             The initial intensity of the X-ray beam.
         mu : float
             The linear attenuation coefficient of the material (in cm^-1).
-        thickness : array-like
+        thickness : float or array-like
             The thickness of the material (in cm).
 
         Returns
         -------
-        array
+        float or array
             The transmitted intensity of the X-ray beam.
         """
-        I = I0 * np.exp(-mu * thickness)
-        return I
+        # Scalar path for direct callers avoids NumPy scalar boxing; the layer
+        # routines in this class are vectorized and do not go through here
+        if np.ndim(thickness) == 0 and np.ndim(mu) == 0:
+            return I0 * math.exp(-mu * thickness)
+
+        # Fused, multithreaded evaluation when numexpr is available
+        if ne is not None:
+            return ne.evaluate("I0 * exp(-mu * t)", local_dict={"I0": I0, "mu": mu, "t": np.asarray(thickness)})
+
+        return I0 * np.exp(-mu * np.asarray(thickness))
     
     def plot_attenuation(self, material_names, energy_levels, colors, I0, thicknesses):
         """
@@ -88,15 +244,14 @@ class XRayAttenuationPlot:
         for material, display_name in material_names.items():
             plt.figure(figsize=(10, 6))
 
+            # Linear attenuation coefficient for every energy level in one batched lookup
+            mus = self.get_linear_attenuation_coefficient(material, energy_levels)
+
+            # Transmitted intensity for all energies at once, shape (energies, thicknesses)
+            I_trans_all = self.transmitted_intensity(I0, mus[:, None], np.asarray(thicknesses)[None, :])
+
             # Plot for each energy level
-            for energy, color in zip(energy_levels, colors):
-                # Calculate linear attenuation coefficient for this specific energy
-                mu = self.get_linear_attenuation_coefficient(material, energy)
-                
-                # Calculate transmitted intensity
-                I_trans = self.transmitted_intensity(I0, mu, thicknesses)
-                
-                # Plot
+            for I_trans, color, energy in zip(I_trans_all, colors, energy_levels):
                 plt.plot(thicknesses, I_trans, color=color, label=f'{energy} MeV')
 
             plt.xlabel(f"{display_name} Thickness (cm)")
@@ -114,20 +269,25 @@ class XRayAttenuationPlot:
         Returns two arrays: positions of the boundaries and the corresponding X-ray intensities.
         """
 
-        I_current = I0
-        positions = [0]
-        intensities = [I_current]
+        tissues = [tissue for tissue, _ in layers]
+        thicks = np.array([thick for _, thick in layers], dtype=float)
+        mus = self._layer_mus(tissues, energy)
 
-        for tissue, thick in layers:
-            mu = self.get_linear_attenuation_coefficient(tissue, energy)
-            I_current = self.transmitted_intensity(I_current, mu, thick)
-            positions.append(positions[-1] + thick)
-            intensities.append(I_current)
+        n = len(thicks)
+        positions = np.empty(n + 1)
+        intensities = np.empty(n + 1)
+        positions[0] = 0.0
+        intensities[0] = I0
+        np.cumsum(thicks, out=positions[1:])
+
+        # Accumulated optical depth at the far side of each layer
+        tau = np.cumsum(mus * thicks)
+        intensities[1:] = I0 * np.exp(-tau)
 
         return positions, intensities
 
     
-    def compute_continuous_attenuation(self, layers, I0=1000, points_per_layer=50):
+    def compute_continuous_attenuation(self, layers, I0=1000, points_per_layer=50, specialize=False):
         """
         Compute the X-ray intensity at a fine grid of points within each layer,
         resulting in a continuous attenuation curve.
@@ -140,27 +300,42 @@ class XRayAttenuationPlot:
             The initial intensity of the X-ray beam.
         points_per_layer : int, optional
             The number of points within each layer at which to compute the X-ray intensity.
+        specialize : bool, optional
+            Use a NumPy kernel generated for this exact layer count (see compile_layered_kernel).
         
         Returns
         -------
-        Two lists: the positions of the points at which the X-ray intensity was computed,
+        Two arrays: the positions of the points at which the X-ray intensity was computed,
         and the corresponding X-ray intensities.
         """
 
-        positions_cont = []
-        intensities_cont = []
-        I_current = I0
-        current_pos = 0
+        if not layers:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+
         energy = self.energies_data[1]
-        for tissue, thick in layers:
-            pos = np.linspace(current_pos, current_pos + thick, points_per_layer)
-            mu = self.get_linear_attenuation_coefficient(tissue, energy)
-            intensity = [self.transmitted_intensity(I_current, mu, p - current_pos) for p in pos]
-            positions_cont.extend(pos)
-            intensities_cont.extend(intensity)
-            I_current = intensity[-1]
-            current_pos += thick
-        
+        tissues, thicks = zip(*layers)
+        thicks = np.asarray(thicks, dtype=np.float32)
+        mus = self._layer_mus(tissues, energy)
+
+        if specialize:
+            # Straight-line NumPy kernel specialized to this layer count
+            kernel = compile_layered_kernel(len(mus), points_per_layer)
+            return kernel(mus, thicks, I0)
+
+        if _kernel is not None:
+            return _kernel(mus, thicks, float(I0), points_per_layer)
+
+        # Start position and optical depth accumulated before each layer
+        starts = np.cumsum(thicks) - thicks
+        tau_prefix = np.cumsum(mus * thicks) - mus * thicks
+
+        # Grid of offsets within each layer, shape (layers, points_per_layer)
+        local = _unit_grid(points_per_layer)[None, :] * thicks[:, None]
+        tau = tau_prefix[:, None] + mus[:, None] * local
+
+        positions_cont = (starts[:, None] + local).ravel()
+        intensities_cont = (I0 * np.exp(-tau)).ravel()
+
         return positions_cont, intensities_cont
     
     def plot_layered_attenuation_plotly(self, layers, colors, energy, I0=1000):
@@ -182,13 +357,17 @@ class XRayAttenuationPlot:
             line=dict(color='blue', width=3)
         ))
 
-        current_pos = 0
-        for tissue, thick in layers:
-            # colored rectangle for each layer
-            fig.add_shape(
+        # layer extents
+        thicks = np.array([thick for _, thick in layers], dtype=float)
+        x0s = np.concatenate(([0.0], np.cumsum(thicks)[:-1]))
+        x1s = x0s + thicks
+
+        # colored rectangle and annotation for each layer, added in a single layout update
+        shapes = [
+            dict(
                 type='rect',
-                x0=current_pos,
-                x1=current_pos + thick,
+                x0=x0,
+                x1=x1,
                 y0=0,
                 y1=I0,
                 fillcolor=colors[tissue],
@@ -196,18 +375,21 @@ class XRayAttenuationPlot:
                 layer='below',
                 line_width=0
             )
-
-            # annotation for each layer
-            fig.add_annotation(
-                x=(current_pos + current_pos + thick) / 2,
+            for x0, x1, (tissue, _) in zip(x0s, x1s, layers)
+        ]
+        annotations = [
+            dict(
+                x=(x0 + x1) / 2,
                 y=I0 * 0.5,
                 text=tissue.replace('_', ' ').title(),
                 showarrow=False
             )
-
-            current_pos += thick
+            for x0, x1, (tissue, _) in zip(x0s, x1s, layers)
+        ]
 
         fig.update_layout(
+            shapes=shapes,
+            annotations=annotations,
             title=f"X-ray Attenuation Through Layered Tissues ({energy} MeV)",
             xaxis_title="Depth (cm)",
             yaxis_title="Intensity (% of initial)",
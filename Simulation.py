@@ -1,4 +1,5 @@
 import os
+import hashlib
 import matplotlib.pyplot as plt
 import matplotlib
 from gvxrPython3 import gvxr
@@ -10,13 +11,22 @@ class XRaySimulation:
     Supports simulation with different model thicknesses and configurations.
     """
     
-    def __init__(self, thickness_type='small', tube_voltage=80):
+    # The gvxr scene is global to the process, so track what is currently loaded
+    # on the class: the thickness type of the loaded models and the beam energy.
+    _loaded_scene = None
+    _loaded_voltage = None
+    
+    def __init__(self, thickness_type='small', tube_voltage=80, interactive=True, use_cache=True):
         """
         Initialize the X-ray simulation.
         
         Args:
             thickness_type (str): Type of model thickness. 
                                   Options: 'small' or 'large'.
+            interactive (bool): Whether to display figures. When False, figures
+                                are only saved to disk.
+            use_cache (bool): Whether to load and save computed images in the
+                              on-disk cache.
         """
         # Validate input
         if thickness_type.lower() not in ['small', 'large']:
@@ -24,12 +34,17 @@ class XRaySimulation:
         
         self.thickness_type = thickness_type.lower()
         self.tube_voltage = tube_voltage
+        self.interactive = interactive
+        self.use_cache = use_cache
         
         # Configure matplotlib
         self._configure_matplotlib()
         
         # Set model paths and names based on thickness
         self._set_model_paths()
+        
+        # Set source, detector, model placement and material settings
+        self._set_scene_parameters()
     
     def _set_model_paths(self):
         """
@@ -47,6 +62,68 @@ class XRaySimulation:
             self.torso_name = "TORSO_Large"
             self.pelvis_name = "PELVIS_Large"
 
+    def _set_scene_parameters(self):
+        """
+        Set source, detector, model placement and material settings based on thickness type.
+        """
+        # Number of photons per ray of the monochromatic beam
+        self.photon_count = 1000
+        
+        if self.thickness_type == 'small':
+            self.source_position = (-5.0, 0.0, 0.0)  # cm
+            self.detector_position = (10.0, 0.0, 0.0)  # cm
+            self.detector_pixels = (500, 430)
+            self.pelvis_translation = (0, 1.3, -10)  # mm
+            self.torso_translation = (0, 0, -10)  # mm
+        else:  # large
+            self.source_position = (-20.0, 1.7, 0.0)  # cm
+            self.detector_position = (20.0, 0.0, 0.0)  # cm
+            self.detector_pixels = (1200, 1200)
+            self.pelvis_translation = (-40, 3.0, -40)  # mm
+            self.torso_translation = (-40, 0, -40)  # mm
+        
+        self.detector_up_vector = (0, 0, -1)
+        self.detector_pixel_size = (0.5, 0.5)  # mm
+        self.model_rotation = (-90, 0, 0, 1)  # angle, axis
+        
+        # Soft tissue (mostly water) and bone (Hydroxyapatite approximation): compound, density in g/cm3
+        self.torso_material = ("H2O", 1.03)
+        self.pelvis_material = ("Ca10(PO4)6(OH)2", 1.92)
+
+    @property
+    def _cache_path(self):
+        """
+        On-disk cache of computed images, keyed by the simulation inputs.
+        
+        The key hashes the beam, source, detector, model placement and material
+        settings together with the size and modification time of the STL files,
+        so changing any of them invalidates previously cached images.
+        """
+        models = []
+        for name, fname in ((self.torso_name, self.fname_torso), (self.pelvis_name, self.fname_pelvis)):
+            stat = os.stat(fname)
+            models.append((name, fname, stat.st_size, stat.st_mtime_ns))
+        
+        config = (
+            self.tube_voltage,
+            self.photon_count,
+            self.source_position,
+            self.detector_position,
+            self.detector_pixels,
+            self.detector_pixel_size,
+            self.detector_up_vector,
+            self.torso_translation,
+            self.pelvis_translation,
+            self.model_rotation,
+            self.torso_material,
+            self.pelvis_material,
+            tuple(models),
+        )
+        digest = hashlib.sha1(repr(config).encode()).hexdigest()[:12]
+        
+        name = f"{self.thickness_type}_{self.tube_voltage}_{digest}.npy"
+        return os.path.join(".xray_cache", name)
+
     def _configure_matplotlib(self):
         """Configure matplotlib font settings."""
         font = {
@@ -57,27 +134,18 @@ class XRaySimulation:
     
     def setup_x_ray_source(self):
         """Configure the X-ray source parameters."""
-        if self.thickness_type == 'small':
-            gvxr.setSourcePosition(-5.0, 0.0, 0.0, "cm")
-        else:
-            gvxr.setSourcePosition(-20.0, 1.7, 0.0, "cm")
-        
+        gvxr.setSourcePosition(*self.source_position, "cm")
         gvxr.usePointSource()
         
         # Set monochromatic beam
-        gvxr.setMonoChromatic(self.tube_voltage, "keV", 1000)
+        gvxr.setMonoChromatic(self.tube_voltage, "keV", self.photon_count)
     
     def setup_detector(self):
         """Configure the X-ray detector parameters."""
-        if self.thickness_type == 'small':
-            gvxr.setDetectorPosition(10.0, 0.0, 0.0, "cm")
-            gvxr.setDetectorNumberOfPixels(500, 430)
-        else:
-            gvxr.setDetectorPosition(20.0, 0.0, 0.0, "cm")
-            gvxr.setDetectorNumberOfPixels(1200, 1200)
-        
-        gvxr.setDetectorUpVector(0, 0, -1)
-        gvxr.setDetectorPixelSize(0.5, 0.5, "mm")
+        gvxr.setDetectorPosition(*self.detector_position, "cm")
+        gvxr.setDetectorNumberOfPixels(*self.detector_pixels)
+        gvxr.setDetectorUpVector(*self.detector_up_vector)
+        gvxr.setDetectorPixelSize(*self.detector_pixel_size, "mm")
     
     def load_and_position_models(self):
         """
@@ -93,30 +161,26 @@ class XRaySimulation:
         gvxr.moveToCentre(self.pelvis_name)
         
         # Translate models
-        if self.thickness_type == 'small':
-            translate_offset = 1.3
-            gvxr.translateNode(self.pelvis_name, 0, translate_offset, -10, "mm")
-            gvxr.translateNode(self.torso_name, 0, 0, -10, "mm")
-        else:
-            translate_offset = 3.0
-            gvxr.translateNode(self.pelvis_name, -40, translate_offset, -40, "mm")
-            gvxr.translateNode(self.torso_name, -40, 0, -40, "mm")
+        gvxr.translateNode(self.pelvis_name, *self.pelvis_translation, "mm")
+        gvxr.translateNode(self.torso_name, *self.torso_translation, "mm")
         
         # Rotate models
-        gvxr.rotateNode(self.torso_name, -90, 0, 0, 1)
-        gvxr.rotateNode(self.pelvis_name, -90, 0, 0, 1)
+        gvxr.rotateNode(self.torso_name, *self.model_rotation)
+        gvxr.rotateNode(self.pelvis_name, *self.model_rotation)
     
     def set_material_properties(self):
         """
         Set material properties for anatomical models.
         """
         # Soft tissue (mostly water)
-        gvxr.setCompound(self.torso_name, "H2O")
-        gvxr.setDensity(self.torso_name, 1.03, "g/cm3")
+        compound, density = self.torso_material
+        gvxr.setCompound(self.torso_name, compound)
+        gvxr.setDensity(self.torso_name, density, "g/cm3")
         
         # Bone (Hydroxyapatite approximation)
-        gvxr.setCompound(self.pelvis_name, "Ca10(PO4)6(OH)2")
-        gvxr.setDensity(self.pelvis_name, 1.92, "g/cm3")
+        compound, density = self.pelvis_material
+        gvxr.setCompound(self.pelvis_name, compound)
+        gvxr.setDensity(self.pelvis_name, density, "g/cm3")
     
     def simulate_x_ray(self):
         """
@@ -125,6 +189,51 @@ class XRaySimulation:
         Returns:
             numpy.ndarray: The computed X-ray image
         """
+        cache_path = self._cache_path if self.use_cache else None
+        
+        # Reuse a previously computed image for the same inputs
+        if cache_path is not None and os.path.exists(cache_path):
+            print(f"Loading cached X-ray image for {self.thickness_type} thickness models...")
+            return np.load(cache_path)
+        
+        self._ensure_scene()
+        x_ray_image = self._render()
+        
+        # Save to the cache so later runs skip the GPU pipeline
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            np.save(cache_path, x_ray_image)
+        
+        return x_ray_image
+    
+    def set_tube_voltage(self, tube_voltage):
+        """
+        Change the tube voltage and recompute the X-ray image, reusing the loaded scene.
+        
+        Args:
+            tube_voltage (float): The new tube voltage in keV
+        
+        Returns:
+            numpy.ndarray: The computed X-ray image
+        """
+        self.tube_voltage = tube_voltage
+        return self.simulate_x_ray()
+    
+    def _ensure_scene(self):
+        """
+        Set up the source, detector and models once; later renders reuse the GPU scene.
+        """
+        cls = XRaySimulation
+        if cls._loaded_scene == self.thickness_type:
+            # Same models already loaded, only the beam energy may need updating
+            if cls._loaded_voltage != self.tube_voltage:
+                gvxr.setMonoChromatic(self.tube_voltage, "keV", self.photon_count)
+                cls._loaded_voltage = self.tube_voltage
+            return
+        
+        # Forget the previous scene first, so a partial reload is never mistaken for a loaded one
+        cls._loaded_scene = cls._loaded_voltage = None
+        
         # Create OpenGL context
         gvxr.createOpenGLContext()
         
@@ -138,11 +247,15 @@ class XRaySimulation:
         # Set material properties
         self.set_material_properties()
         
-        # Compute X-ray image
+        cls._loaded_scene = self.thickness_type
+        cls._loaded_voltage = self.tube_voltage
+    
+    def _render(self):
+        """
+        Compute the X-ray image for the current scene.
+        """
         print(f"Computing X-ray image for {self.thickness_type} thickness models...")
-        x_ray_image = gvxr.computeXRayImage()
-        
-        return x_ray_image
+        return np.array(gvxr.computeXRayImage())
     
     def visualize_x_ray(self, x_ray_image):
         """
@@ -151,7 +264,7 @@ class XRaySimulation:
         Args:
             x_ray_image (numpy.ndarray): The X-ray image to visualize
         """
-        plt.figure(figsize=(15, 7.5))
+        fig = plt.figure(figsize=(15, 7.5))
         plt.suptitle(f"(Relatively {self.thickness_type.capitalize()} Thickness) \n(Tube Voltage: {self.tube_voltage} KeV)", y=0.5)
 
         
@@ -162,7 +275,12 @@ class XRaySimulation:
         plt.title("Linear Color Scale")
         
         plt.tight_layout()
-        plt.show()
+        fig.savefig(f"xray_{self.thickness_type}_{self.tube_voltage}.png")
+        
+        if self.interactive:
+            plt.show()
+        else:
+            plt.close(fig)
     
     def run(self):
         """
@@ -174,12 +292,14 @@ class XRaySimulation:
 def main():
     """Main function to demonstrate X-ray simulation."""
     # Simulate with small thickness models
-    small_thickness_sim = XRaySimulation(thickness_type='small')
+    small_thickness_sim = XRaySimulation(thickness_type='small', interactive=False)
     small_thickness_sim.run()
     
     # Simulate with large thickness models
-    large_thickness_sim = XRaySimulation(thickness_type='large')
+    large_thickness_sim = XRaySimulation(thickness_type='large', interactive=False)
     large_thickness_sim.run()
 
 if __name__ == "__main__":
+    # Figures are only saved when run as a script, so skip the GUI backend
+    matplotlib.use('Agg')
     main()
\ No newline at end of file